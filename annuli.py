@@ -468,10 +468,10 @@ def main(arguments = None):
         # LEMONdBMiner.get_star() returns a five-element tuple with the x and y
         # coordinates, right ascension, declination and instrumental magnitude
         # of the astronomical object in the sources image.
-        for star_id, _ in cstars:
-            ra, dec = miner.get_star(star_id)[2:4]
-            os.write(coords_fd, "%.10f\t%.10f\n" % (ra, dec))
-        os.close(coords_fd)
+        with os.fdopen(coords_fd, 'w') as coords_file:
+            for star_id, _ in cstars:
+                ra, dec = miner.get_star(star_id)[2:4]
+                coords_file.write("%.10f\t%.10f\n" % (ra, dec))
 
         msg = "%sStar coordinates for %s temporarily saved to %s"
         print msg % (style.prefix, pfilter, coordinates_files[pfilter])
@@ -541,6 +541,5 @@ def sextractor(path, ext = 0, options = None, stdout = None, stderr = None):
         subprocess.check_call(args, stdout = stdout, stderr = stderr)
         return catalog_path
     except subprocess.CalledProcessError, e:
-        try: os.unlink(catalog_path)
-        except (IOError, OSError): pass
+        util.clean_tmp_files(catalog_path)
         raise SExtractorError(e.returncode, e.cmd)
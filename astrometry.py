@@ -62,6 +62,9 @@ to work it is also necessary to download the index files.
 
 ASTROMETRY_COMMAND = 'solve-field'
 ASTROMETRY_REQUIRED_VERSION = (0, 68)
+# Maximum number of bytes of the output of solve-field that are included in
+# AstrometryNetError exceptions, if its output was captured (verbosity = 0).
+ASTROMETRY_OUTPUT_TAIL = 64 * 1024
 
 # The Queue is global -- this works, but note that we could have
 # passed its reference to the function managed by pool.map_async.
@@ -74,7 +77,14 @@ class AstrometryNetNotInstalled(StandardError):
 
 class AstrometryNetError(subprocess.CalledProcessError):
     """ Raised if the execution of Astrometry.net fails """
-    pass
+
+    def __str__(self):
+        msg = super(AstrometryNetError, self).__str__()
+        # The tail of the output of solve-field, if it was captured
+        if self.output:
+            tail = "\nLast lines of output of %s:\n%s"
+            msg += tail % (ASTROMETRY_COMMAND, self.output.rstrip())
+        return msg
 
 class AstrometryNetUnsolvedField(subprocess.CalledProcessError):
     """ Raised if Astrometry.net could not solve the field """
@@ -102,8 +112,16 @@ class AstrometryNetUpgradeRequired(Exception):
     pass
 
 
+@util.memoize
 def astrometry_net_version():
-    """ Return the Astrometry.net version as a tuple, e.g. (0, 78)."""
+    """ Return the Astrometry.net version as a tuple, e.g. (0, 78).
+
+    The version is determined by parsing the output of 'solve-field --help',
+    something that we would otherwise be doing for every image that we solve.
+    Since the installed version is not going to change while we are running,
+    the result is memoized, so that the subprocess is spawned just once.
+
+    """
 
     # For example: "Revision 0.78, date Mon_Apr_22_12:25:30_2019_-0400."
     PATTERN = "^Revision (\d\.\d{1,2}), date.*"
@@ -120,8 +138,8 @@ def astrometry_net_version():
     return tuple(int(x) for x in version.split('.'))
 
 
-def astrometry_net(path, ra = None, dec = None, radius = 1,
-                   verbosity = 0, timeout = None, options = None):
+def astrometry_net(path, ra = None, dec = None, radius = 1, verbosity = 0,
+                   timeout = None, options = None, new_fits_dir = None):
     """ Do astrometry on a FITS image using Astrometry.net.
 
     Use a local build of the amazing Astrometry.net software [1] in order to
@@ -179,13 +197,16 @@ def astrometry_net(path, ra = None, dec = None, radius = 1,
               take any, when they must map to None (e.g., {'--invert' : None}).
               Both options and values should be given as strings, but they will
               be automatically cast to string just to be safe.
+    new_fits_dir - the directory where the new FITS file, containing the WCS
+                   header, is created. If not given, the default directory
+                   for temporary files is used. Use the directory to which
+                   the file is going to be moved afterwards: if it is in the
+                   same filesystem, moving it is a simple rename, while
+                   otherwise the entire file would have to be copied.
 
     """
 
-    emsg = "'%s' not found in the current environment"
-    if not util.which(ASTROMETRY_COMMAND):
-        raise AstrometryNetNotInstalled(emsg % ASTROMETRY_COMMAND)
-
+    # Raises AstrometryNetNotInstalled if solve-field is not in PATH
     if astrometry_net_version() < ASTROMETRY_REQUIRED_VERSION:
         # From, for example, (0, 68) to '0.68'
         version_str = '.'.join(str(x) for x in ASTROMETRY_REQUIRED_VERSION)
@@ -199,7 +220,8 @@ def astrometry_net(path, ra = None, dec = None, radius = 1,
     output_dir = tempfile.mkdtemp(**kwargs)
 
     # Path to the temporary FITS file containing the WCS header
-    kwargs = dict(prefix = '%s_astrometry_' % root, suffix = ext)
+    kwargs = dict(prefix = '%s_astrometry_' % root, suffix = ext,
+                  dir = new_fits_dir)
     with tempfile.NamedTemporaryFile(**kwargs) as fd:
         output_path = fd.name
 
@@ -212,12 +234,23 @@ def astrometry_net(path, ra = None, dec = None, radius = 1,
     # --no-plots: don't create any plots of the results.
     # --new-fits: the new FITS file containing the WCS header.
     # --overwrite: overwrite output files if they already exist.
+    #
+    # --match, --rdls, --corr, --index-xyls: the auxiliary output files. We
+    # only need the new FITS file and the .solved file, and these ones would
+    # be deleted along with the output directory, so it is a waste of time to
+    # create them -- the last three, in particular, require Astrometry.net to
+    # read again the index files to project the reference stars on the image.
+    # Setting them to 'none' tells solve-field not to write them at all.
 
     args = [ASTROMETRY_COMMAND, path,
             '--dir', output_dir,
             '--no-plots',
             '--new-fits', output_path,
-            '--overwrite']
+            '--overwrite',
+            '--match', 'none',
+            '--rdls', 'none',
+            '--corr', 'none',
+            '--index-xyls', 'none']
 
     # -3 / --ra <degrees or hh:mm:ss>: only search in indexes within 'radius'
     # of the field center given by 'ra' and 'dec'
@@ -257,15 +290,18 @@ def astrometry_net(path, ra = None, dec = None, radius = 1,
             else:
                 args += [opt, str(value)]
 
-    # Needed when 'verbosity' is 0
-    null_fd = open(os.devnull, 'w')
+    # When 'verbosity' is 0, instead of sending the standard output and error
+    # of Astrometry.net to the null device, capture them through a pipe. They
+    # are still not shown, but in case solve-field fails the last lines of its
+    # output are attached to the AstrometryNetError exception, so that we do
+    # not have to run it again with -v flags to find out what went wrong.
 
     try:
-        kwargs = dict(timeout = timeout)
         if not verbosity:
-            kwargs['stdout'] = kwargs['stderr'] = null_fd
-
-        subprocess.check_call(args, **kwargs)
+            subprocess.check_output(args, stderr = subprocess.STDOUT,
+                                    timeout = timeout)
+        else:
+            subprocess.check_call(args, timeout = timeout)
 
         # .solved file must exist and contain a binary one
         with open(solved_file, 'rb') as fd:
@@ -274,15 +310,23 @@ def astrometry_net(path, ra = None, dec = None, radius = 1,
 
         return output_path
 
+    # If the field is not solved, the new FITS file (if solve-field got to
+    # create it at all) is not returned to the caller, so we have to delete
+    # it ourselves. Otherwise it would be left behind in 'new_fits_dir'.
+
     except subprocess.CalledProcessError, e:
-        raise AstrometryNetError(e.returncode, e.cmd)
+        util.clean_tmp_files(output_path)
+        # Keep only the tail of the output, if it was captured
+        output = e.output[-ASTROMETRY_OUTPUT_TAIL:] if e.output else None
+        raise AstrometryNetError(e.returncode, e.cmd, output)
     # If .solved file doesn't exist or contain one
     except (IOError, AstrometryNetUnsolvedField):
+        util.clean_tmp_files(output_path)
         raise AstrometryNetUnsolvedField(path)
     except subprocess.TimeoutExpired:
+        util.clean_tmp_files(output_path)
         raise AstrometryNetTimeoutExpired(path, timeout)
     finally:
-        null_fd.close()
         util.clean_tmp_files(output_dir)
 
 @util.print_exception_traceback
@@ -346,7 +390,8 @@ def parallel_astrometry(args):
                   radius = options.radius,
                   verbosity = options.verbose,
                   timeout = options.timeout,
-                  options = options.solve_field_options)
+                  options = options.solve_field_options,
+                  new_fits_dir = output_dir)
 
     try:
         output_path = astrometry_net(img.path, **kwargs)
@@ -380,9 +425,10 @@ def parallel_astrometry(args):
     msg2 = "[Astrometry] WCS solution found by Astrometry.net"
     msg3 = "[Astrometry] Original image: %s" % img.path
 
-    output_img.add_history(msg1)
-    output_img.add_history(msg2)
-    output_img.add_history(msg3)
+    with output_img.batch_update():
+        output_img.add_history(msg1)
+        output_img.add_history(msg2)
+        output_img.add_history(msg3)
     logging.debug("%s: header of output image (%s) updated" % debug_args)
 
     queue.put(output_img.path)
@@ -506,16 +552,46 @@ def main(arguments = None):
         print msg % style.prefix
         sys.exit(style.error_exit_message)
 
+    # Otherwise, solve-field would be killed as soon as it is launched, for
+    # each one of the images, so fail now instead of after going through all
+    # of them. The same goes for the number of processes of the pool.
+    if options.timeout <= 0:
+        msg = "%sError: --timeout must be a positive number of seconds"
+        print msg % style.prefix
+        sys.exit(style.error_exit_message)
+
+    if options.ncores < 1:
+        msg = "%sError: --cores must be a positive integer"
+        print msg % style.prefix
+        sys.exit(style.error_exit_message)
+
     # Make sure that the output directory exists; create it if it doesn't.
     util.determine_output_dir(output_dir)
 
+    # Determine the version of Astrometry.net before the pool of processes is
+    # created: as astrometry_net_version() is memoized, the forked processes
+    # inherit the result and none of them has to run 'solve-field --help'
+    # again. This also allows us to abort here if solve-field is not
+    # installed, instead of doing it once for each input image.
+    try:
+        astrometry_net_version()
+    except AstrometryNetNotInstalled:
+        msg = "%sError: '%s' not found in the current environment"
+        print msg % (style.prefix, ASTROMETRY_COMMAND)
+        sys.exit(style.error_exit_message)
+
     print "%sUsing a local build of Astrometry.net." % style.prefix
     msg = "%sDoing astrometry on the %d paths given as input."
     print msg % (style.prefix, len(input_paths))
 
+    # The time that Astrometry.net needs to solve an image varies wildly (from
+    # a few seconds to the --timeout limit), so the images are handed to the
+    # processes of the pool one at a time. Otherwise, map_async() would chop
+    # the iterable into large chunks and some of the processes could end up
+    # idle while others are still working on several difficult images.
     pool = multiprocessing.Pool(options.ncores)
     map_async_args = ((path, output_dir, options) for path in input_paths)
-    result = pool.map_async(parallel_astrometry, map_async_args)
+    result = pool.map_async(parallel_astrometry, map_async_args, chunksize = 1)
 
     while not result.ready():
         time.sleep(1)
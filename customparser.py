@@ -34,17 +34,14 @@ class NewlinesFormatter(optparse.IndentedHelpFormatter):
     def _format_text(self, text):
         text_width = self.width - self.current_indent
         indent = ' ' * self.current_indent
-        # Wrap one paragraph at a time, then concatenate them
-        formatted_text = ""
-        for paragraph in text.split('\n\n'):
-
-            formatted_text += textwrap.fill(paragraph.strip(),
-                                            text_width,
-                                            initial_indent=indent,
-                                            subsequent_indent=indent)
-            formatted_text += '\n\n'
-
-        return formatted_text.rstrip()
+        # Wrap one paragraph at a time, then join them all at once
+        paragraphs = [textwrap.fill(paragraph.strip(),
+                                    text_width,
+                                    initial_indent=indent,
+                                    subsequent_indent=indent)
+                      for paragraph in text.split('\n\n')]
+
+        return '\n\n'.join(paragraphs).rstrip()
 
 def check_passband(option, opt, value):
     """ Type-checking function for the 'passband' optparse option type.
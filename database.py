@@ -27,8 +27,11 @@ the information that may be needed for the data analysis.
 
 """
 
+import astropy.coordinates
+import astropy.units
 import collections
 import copy
+import functools
 import itertools
 import math
 import numpy
@@ -41,7 +44,6 @@ import sqlite3
 import tempfile
 
 # LEMON modules
-import astromatic
 import json_parse
 import passband
 import util
@@ -1016,6 +1018,23 @@ class LEMONdB(object):
         self._execute("SELECT id FROM stars ORDER BY id ASC")
         return list(x[0] for x in self._rows)
 
+    def _has_star(self, star_id):
+        """ Determine whether there is a star in the database with this ID.
+
+        This is equivalent to 'star_id in self.star_ids', but looks up the ID
+        in the primary key index instead of loading the IDs of all the stars
+        into memory -- and for some methods, such as get_light_curve(), this
+        check may be done once for each one of the stars in the database.
+
+        """
+
+        # Note the cast to Python's built-in int. Otherwise, if the method gets
+        # a NumPy integer, SQLite raises "sqlite3.InterfaceError: Error binding
+        # parameter - probably unsupported type"
+        t = (int(star_id), )
+        self._execute("SELECT 1 FROM stars WHERE id = ?", t)
+        return self._rows.fetchone() is not None
+
     def add_pm_correction(self, star_id, unix_time, pfilter, pm_x, pm_y):
         """ Store the proper-motion corrected pixel coordinates of a star.
 
@@ -1081,7 +1100,7 @@ class LEMONdB(object):
             rows = tuple(self._rows)
             return rows[0]
         except IndexError:
-            if star_id not in self.star_ids:
+            if not self._has_star(star_id):
                 msg = "star with ID = %d not in database" % star_id
                 raise KeyError(msg)
             else:
@@ -1114,7 +1133,7 @@ class LEMONdB(object):
             raise UnknownImageError(str(e))
 
         except sqlite3.IntegrityError:
-            if not star_id in self.star_ids:
+            if not self._has_star(star_id):
                 msg = "star with ID = %d not in database" % star_id
                 raise UnknownStarError(msg)
 
@@ -1133,7 +1152,7 @@ class LEMONdB(object):
 
         """
 
-        if star_id not in self.star_ids:
+        if not self._has_star(star_id):
             msg = "star with ID = %d not in database" % star_id
             raise KeyError(msg)
 
@@ -1162,7 +1181,7 @@ class LEMONdB(object):
 
         """
 
-        if star_id not in self.star_ids:
+        if not self._has_star(star_id):
             msg = "star with ID = %d not in database" % star_id
             raise KeyError(msg)
 
@@ -1229,7 +1248,7 @@ class LEMONdB(object):
             raise UnknownImageError(str(e))
 
         except sqlite3.IntegrityError:
-            if not star_id in self.star_ids:
+            if not self._has_star(star_id):
                 msg = "star with ID = %d not in database" % star_id
                 raise UnknownStarError(msg)
 
@@ -1272,7 +1291,7 @@ class LEMONdB(object):
 
         except sqlite3.IntegrityError:
             self._rollback_to(mark)
-            if star_id not in self.star_ids:
+            if not self._has_star(star_id):
                 msg = "star with ID = %d not in database" % star_id
                 raise UnknownStarError(msg)
             else:
@@ -1367,7 +1386,7 @@ class LEMONdB(object):
                 cstars, cweights, cstdevs = zip(*rows)
 
         else:
-            if star_id not in self.star_ids:
+            if not self._has_star(star_id):
                 msg = err_msg + "not in database"
                 raise KeyError(msg)
 
@@ -1651,18 +1670,24 @@ class LEMONdB(object):
             raise ValueError("database is empty")
 
         self._execute("SELECT id, ra, dec FROM stars")
-
-        closest_id = None
-        closest_distance = float('inf')
-        coordinates = astromatic.Coordinates(ra, dec)
-        for star_id, star_ra, star_dec in self._rows:
-            star_coords = astromatic.Coordinates(star_ra, star_dec)
-            star_distance = coordinates.distance(star_coords)
-            if star_distance < closest_distance:
-                closest_id = star_id
-                closest_distance = star_distance
-
-        return closest_id, closest_distance
+        stars_ids, stars_ra, stars_dec = zip(*self._rows)
+
+        # Compute the angular distances to all the stars at once, using a
+        # single SkyCoord object with an array of coordinates, instead of using
+        # Coordinates.distance(), which creates two SkyCoord objects for each
+        # star: this method is called every time that the user right-clicks on
+        # the finding chart, and there may be tens of thousands of stars.
+        make_coord = functools.partial(
+            astropy.coordinates.SkyCoord, unit=astropy.units.deg)
+        coordinates = make_coord(ra=ra, dec=dec)
+        # Note that tuples would be interpreted as (degrees, minutes, seconds)
+        stars_coords = make_coord(ra=numpy.array(stars_ra),
+                                  dec=numpy.array(stars_dec))
+        distances = coordinates.separation(stars_coords).deg
+
+        # In case of a tie, numpy.argmin() returns the first star, as before
+        index = numpy.argmin(distances)
+        return stars_ids[index], distances[index]
 
 def _add_metadata_property(name):
     """ Dynamically add a property to the LEMONdB class.
@@ -27,10 +27,58 @@ import setup
 
 desc = {} # option descriptions (for optparse)
 
-ncores = multiprocessing.cpu_count()
+# The file from which the Linux kernel exposes the CPU affinity of the process
+PROC_STATUS_PATH = '/proc/self/status'
+
+def _count_cpus(cpus_list):
+    """ Return the number of CPUs in a Linux 'list format' string.
+
+    This is the format of the Cpus_allowed_list field of /proc/<pid>/status: a
+    comma-separated list of CPU numbers and inclusive ranges of them, such as
+    '0-3,8,10-11' (that is, seven CPUs). ValueError is raised if the string
+    cannot be parsed.
+
+    """
+
+    count = 0
+    for item in cpus_list.strip().split(','):
+        first, _, last = item.partition('-')
+        count += int(last or first) - int(first) + 1
+    return count
+
+def _available_cores(status_path = PROC_STATUS_PATH):
+    """ Return the number of CPUs that this process is allowed to run on.
+
+    multiprocessing.cpu_count() returns the number of CPUs in the system, but
+    the process may be restricted to only some of them (e.g., with taskset or
+    when running in a container), in which case using that many processes
+    would only result in them competing for the available cores. Therefore,
+    use the CPU affinity mask of the process, if it is available. Python 2
+    has no os.sched_getaffinity() (it was added in Python 3.3), so read it
+    from the Cpus_allowed_list field of /proc/self/status -- which, of course,
+    only exists on Linux. Otherwise, fall back to the number of CPUs.
+
+    """
+
+    try:
+        with open(status_path) as fd:
+            for line in fd:
+                key, _, value = line.partition(':')
+                if key == 'Cpus_allowed_list':
+                    count = _count_cpus(value)
+                    if count > 0:
+                        return count
+                    break
+    except (IOError, ValueError):
+        pass
+
+    return multiprocessing.cpu_count()
+
+ncores = _available_cores()
 desc['ncores'] = \
 "the maximum number of cores available to the module. This option " \
-"defaults to the number of CPUs in the system, which are automatically " \
+"defaults to the number of CPUs in the system (or, if available, to those " \
+"which the process is allowed to run on), which are automatically " \
 "detected [default: %default]"
 
 maximum = 50000
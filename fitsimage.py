@@ -32,6 +32,7 @@ import astropy.io
 import astropy.wcs
 import calendar
 import collections
+import contextlib
 import datetime
 import fnmatch
 import hashlib
@@ -43,6 +44,7 @@ import os
 import os.path
 import pyfits
 import re
+import time
 import warnings
 
 # LEMON modules
@@ -57,6 +59,50 @@ import style
 # https://github.com/geminiutil/geminiutil/commit/9aa46fd9cd3
 warnings.filterwarnings('ignore', message=".+ a HIERARCH card will be created.")
 
+# The leftmost substring of non-numeric characters; see FITSImage.prefix
+PREFIX_REGEXP = re.compile('^\D*')
+
+# Number of bytes read from disk at a time by FITSImage.sha1sum (1 MiB)
+SHA1_BLOCK_SIZE = 2 ** 20
+
+# FITSImage.sha1sum is not cached if the file was modified less than these
+# many seconds before the checksum was computed. File timestamps have limited
+# resolution (two seconds on FAT, one on ext3), so the file could be written
+# again, with the same size, without its modification or change times being
+# altered -- and then we would have no way of knowing that it has changed.
+SHA1_CACHE_MIN_AGE = 2
+
+# 00:00:00 UTC on 1 January 1970, as a naive datetime; see FITSImage.date()
+UNIX_EPOCH = datetime.datetime(1970, 1, 1)
+
+# The date formats understood by FITSImage.date(). They are compiled only once,
+# at import time, instead of every time that the method is called. There are
+# two formats which only store the date, without the time: 'yy/dd/dd'
+# (deprecated, may be used only for dates 1900-1999) and 'yyyy-mm-dd' (new,
+# Y2K-compliant format).
+_OLD_DATE_PATTERN = '\d{2}/\d{2}/\d{2}'
+_DATE_PATTERN = '\d{4}-\d{2}-\d{2}' # 'yyyy-mm-dd'
+
+# 'HH:MM:SS[.sss]': the time format. Note that we allow up to four decimals in
+# the seconds [.ssss], instead of three. This is not standard, but used anyway
+# in the header of O2K CAHA FITS images.
+_TIME_PATTERN = '\d{2}:\d{2}:\d{2}(?P<secs_fraction>\.\d{0,4})?'
+
+# 'yyyy-mm-ddTHH:MM:SS[.sss]: the format that ideally we would always come
+# across. It contains both the date and time at the start of the observation,
+# so there is no need to read a second keyword (TIME-OBS, for example) to
+# extract the time.
+COMPLETE_DATE_REGEXP = re.compile('%sT%s' % (_DATE_PATTERN, _TIME_PATTERN))
+
+# Either 'yy/mm/dd' or 'yyyy-mm-dd', with nothing else
+ONLY_DATE_REGEXP = re.compile('^((?P<old>%s)|(?P<new>%s))$' %
+                              (_OLD_DATE_PATTERN, _DATE_PATTERN))
+NEW_DATE_REGEXP = re.compile('^%s$' % _DATE_PATTERN)
+TIME_REGEXP = re.compile('^%s$' % _TIME_PATTERN)
+
+# Shell patterns that only match an extension (e.g. '*.fits'); see find_files()
+SUFFIX_PATTERN_REGEXP = re.compile('^\*\.[A-Za-z0-9]+$')
+
 class NonStandardFITS(IOError):
     """ Raised when a non-standard file is attempted to be opened."""
     pass
@@ -101,6 +147,20 @@ class FITSImage(object):
 
         self.path = path
 
+        # The FITS file opened in 'update' mode by batch_update(), if any
+        self._update_handler = None
+
+        # Values returned by read_keyword(), mapped to the keyword exactly as it
+        # was given (i.e., not converted to upper-case), see read_keyword()
+        self._keywords = {}
+
+        # The value of the 'prefix' property, computed when first accessed
+        self._prefix = None
+
+        # The last SHA-1 checksum, as a (key, hexdigest) tuple: the key is a
+        # (st_ino, st_size, st_mtime, st_ctime) tuple, see sha1sum
+        self._sha1sum = None
+
         try:
             # The file must be opened to make sure it is a standard FITS.
             # We would rather use the with statement, but in that case we
@@ -120,8 +180,12 @@ class FITSImage(object):
                 # always contain the 'SIMPLE' keyword. Refer to this link for
                 # more info: https://github.com/spacetelescope/PyFITS/issues/94
 
+                # Use the info() method of the HDUList that we have already
+                # opened, which is exactly what pyfits.info() does internally;
+                # calling the latter would open (and parse) the file again.
+
                 try:
-                    type_ = pyfits.info(self.path, output=False)[0][2]
+                    type_ = handler.info(output = False)[0][2]
                     if type_ == 'NonstandardHDU':
                         # 'SIMPLE' exists but does not equal 'T'
                         msg = "%s: value of 'SIMPLE' keyword is not 'T'"
@@ -141,8 +205,28 @@ class FITSImage(object):
                 # if modified, we will have to take care of 'reloading' (call
                 # it synchronize, if you wish) the header.
 
-                self.size = handler[0].data.shape[::-1]
-                self._header = handler[0].header
+                # The dimensions of the image are read from the NAXISn
+                # keywords, instead of using the shape of the data array: the
+                # latter would force PyFITS to read (or, at least, memory-map)
+                # the entire data unit, while as long as we do not touch it
+                # only the header has to be parsed. The order is the same as
+                # that of data.shape[::-1]: (NAXIS1, NAXIS2, ...)
+
+                header = handler[0].header
+                naxis = header['NAXIS']
+
+                # NAXIS = 0 means that the primary HDU has no data array at
+                # all, such as the empty primary HDU of multi-extension FITS
+                # files. This is valid FITS, but not an image that we can
+                # work with -- reading data.shape raised AttributeError here,
+                # as the data attribute was None.
+                if not naxis:
+                    msg = "%s: primary HDU has no data (NAXIS = 0)"
+                    raise NonStandardFITS(msg % self.path)
+
+                self.size = tuple(header['NAXIS%d' % axis]
+                                  for axis in xrange(1, naxis + 1))
+                self._header = header
             finally:
                 handler.close(output_verify = 'ignore')
 
@@ -150,7 +234,10 @@ class FITSImage(object):
         # if we attempt to open a non-FITS file, and also if we open one whose
         # first keyword is not either SIMPLE or XTENSION. Nothing is raised if
         # the value of SIMPLE is 'F'; that is why we had to specifically make
-        # sure it was 'T' a few lines above.
+        # sure it was 'T' a few lines above. NonStandardFITS, raised by us
+        # above, is a subclass of IOError, so let it propagate untouched.
+        except NonStandardFITS:
+            raise
         except IOError, e:
             pyfits_msg = "Block does not begin with SIMPLE or XTENSION"
             if str(e) == pyfits_msg:
@@ -180,18 +267,86 @@ class FITSImage(object):
         whitespace between 'HIERARCH' and the keyword name: e.g., you must
         write 'HIERARCH AMBI WIND SPEED', never 'HIERARCHAMBI WIND SPEED'.
 
+        The values of the keywords are cached in a dictionary the first time
+        they are read, as looking up a keyword in a PyFITS Header is much slower
+        than doing it in a dictionary, and most LEMON commands read the same
+        handful of keywords (e.g., the date or exposure time) over and over.
+        The cache is cleared whenever the header of the image is modified.
+
         """
 
         if keyword is None:
             raise TypeError("keyword cannot be None")
         if not keyword:
             raise ValueError("keyword cannot be empty")
+
+        # The cache is indexed by the keyword as given by the caller, without
+        # converting it to upper-case: the same keywords are almost always
+        # requested with the same spelling, so in this manner we can skip the
+        # call to str.upper() when the value is already in the cache.
         try:
-            return self._header[keyword.upper()]
+            return self._keywords[keyword]
+        except KeyError:
+            pass
+
+        try:
+            value = self._header[keyword.upper()]
         except KeyError:
             msg = "%s: keyword '%s' not found" % (self.path, keyword)
             raise KeyError(msg)
 
+        self._keywords[keyword] = value
+        return value
+
+    @contextlib.contextmanager
+    def batch_update(self):
+        """ Context manager to apply multiple changes to the FITS header at once.
+
+        Each call to update_keyword(), delete_keyword() and add_history() opens
+        the FITS file in 'update' mode, parses its header, modifies it and then
+        writes the header back to disk when the file is closed. If we need to
+        make many changes, it is much faster to do all of them while the file
+        is opened only once. Within the body of the with statement, the three
+        methods modify the header of the already-open FITS file, which is
+        written to disk (and closed) only on exit from the with statement.
+
+        The header is returned by __enter__(), in case it has to be worked with
+        directly, using the PyFITS API. The in-memory copy of the header is
+        updated on exit, so any changes are visible to read_keyword() after
+        the body of the with statement. For example:
+
+        with img.batch_update():
+            img.update_keyword('OBSERVER', 'Edwin Hubble')
+            img.add_history('Observer name fixed')
+
+        Nested calls are allowed, and reuse the file opened by the outermost
+        one, which is the only one that writes the header to disk on exit.
+
+        """
+
+        if self._update_handler is not None:
+            yield self._update_handler[0].header
+            return
+
+        # The file is going to be modified: forget its SHA-1 checksum
+        self._sha1sum = None
+        handler = pyfits.open(self.path, mode = 'update')
+        msg = "%s: file opened to update its header" % self.path
+        logging.debug(msg)
+        self._update_handler = handler
+
+        try:
+            yield handler[0].header
+        finally:
+            # Update in-memory copy of the FITS header
+            self._header = handler[0].header
+            self._keywords.clear()
+            self._sha1sum = None
+            self._update_handler = None
+            handler.close(output_verify = 'ignore')
+            msg = "%s: file closed" % self.path
+            logging.debug(msg)
+
     def update_keyword(self, keyword, value, comment = None):
         """ Updates the value of a FITS keyword, adding it if it does not exist.
 
@@ -216,65 +371,57 @@ class FITSImage(object):
                   "contains spaces; a HIERARCH card will be created"
             logging.debug(msg % (self.path, keyword))
 
-        handler = pyfits.open(self.path, mode = 'update')
-        msg = "%s: file opened to update '%s' keyword" % (self.path, keyword)
-        logging.debug(msg)
-
-        try:
-            header = handler[0].header
-
-            # Ignore the 'card is too long, comment is truncated' warning
-            # printed by PyRAF in case, well, the comment is too long.
-            with warnings.catch_warnings():
-                warnings.simplefilter('ignore')
-                header[keyword] = (value, comment)
-                args = self.path, keyword, value
-                msg = "%s: keyword '%s' updated to '%s'" % args
-                if comment:
-                    msg += " with comment '%s'" % comment
-                logging.debug(msg)
+        with self.batch_update() as header:
 
-            # Update in-memory copy of the FITS header
-            self._header = header
-
-        except ValueError, e:
+            msg = "%s: updating '%s' keyword" % (self.path, keyword)
+            logging.debug(msg)
 
-            # ValueError is raised if a HIERARCH keyword is used and the total
-            # length (keyword, equal sign string and value) is greater than 80
-            # characters. The default exception message is a bit cryptic ("The
-            # keyword {...} with its value is too long"), so add some more
-            # information to help the user understand what went wrong.
-
-            pattern = "The keyword .*? with its value is too long"
-            if re.match(pattern, str(e)):
-                assert len(keyword) > 8
-                msg = ("%s: keyword '%s' could not be updated (\"%s\"). Note "
-                       "that PyFITS does not support CONTINUE for HIERARCH. "
-                       "In other words: if your keyword has more than eight "
-                       "characters or contains spaces, the total length of "
-                       "the keyword with its value cannot be longer than %d "
-                       "characters.")
-                args = self.path, keyword, str(e), pyfits.Card.length
-                logging.warning(msg % args)
-                raise ValueError(msg % args)
-            else:
-                # Different ValueError, re-raise it
+            try:
+                # Ignore the 'card is too long, comment is truncated' warning
+                # printed by PyRAF in case, well, the comment is too long.
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    header[keyword] = (value, comment)
+                    args = self.path, keyword, value
+                    msg = "%s: keyword '%s' updated to '%s'" % args
+                    if comment:
+                        msg += " with comment '%s'" % comment
+                    logging.debug(msg)
+
+            except ValueError, e:
+
+                # ValueError is raised if a HIERARCH keyword is used and the
+                # total length (keyword, equal sign string and value) is
+                # greater than 80 characters. The default exception message is
+                # a bit cryptic ("The keyword {...} with its value is too
+                # long"), so add some more information to help the user
+                # understand what went wrong.
+
+                pattern = "The keyword .*? with its value is too long"
+                if re.match(pattern, str(e)):
+                    assert len(keyword) > 8
+                    msg = ("%s: keyword '%s' could not be updated (\"%s\"). "
+                           "Note that PyFITS does not support CONTINUE for "
+                           "HIERARCH. In other words: if your keyword has more "
+                           "than eight characters or contains spaces, the total "
+                           "length of the keyword with its value cannot be "
+                           "longer than %d characters.")
+                    args = self.path, keyword, str(e), pyfits.Card.length
+                    logging.warning(msg % args)
+                    raise ValueError(msg % args)
+                else:
+                    # Different ValueError, re-raise it
+                    msg = "%s: keyword '%s' could not be updated (%s)"
+                    args = self.path, keyword, e
+                    logging.warning(msg % args)
+                    raise
+
+            except Exception, e:
                 msg = "%s: keyword '%s' could not be updated (%s)"
                 args = self.path, keyword, e
                 logging.warning(msg % args)
                 raise
 
-        except Exception, e:
-            msg = "%s: keyword '%s' could not be updated (%s)"
-            args = self.path, keyword, e
-            logging.warning(msg % args)
-            raise
-
-        finally:
-            handler.close(output_verify = 'ignore')
-            msg = "%s: file closed" % self.path
-            logging.debug(msg)
-
     def delete_keyword(self, keyword):
         """ Delete a keyword from the header of the FITS image.
 
@@ -284,9 +431,7 @@ class FITSImage(object):
 
         """
 
-        handler = pyfits.open(self.path, mode = 'update')
-        try:
-            header = handler[0].header
+        with self.batch_update() as header:
             try:
                 # Ignore DeprecationWarning: "Deletion of non-existent
                 # keyword [...] In a future PyFITS version Header.__delitem__
@@ -296,16 +441,12 @@ class FITSImage(object):
                 with warnings.catch_warnings():
                     warnings.simplefilter("ignore")
                     del header[keyword]
-                # Update in-memory copy of the FITS header
-                self._header = header
 
             # Future versions of PyFITS (by 3.2 or 3.3, most probably) will
             # raise KeyError when a non-existent keyword is deleted, just
             # like a dictionary would, so we better get ready for this.
             except KeyError:
                 pass
-        finally:
-            handler.close(output_verify = 'ignore')
 
     def add_history(self, history):
         """ Add another record to the history of the FITS image.
@@ -314,17 +455,12 @@ class FITSImage(object):
         associated value; columns 9-80 may contain any ASCII text. The text
         should contain a history of steps and procedures associated with the
         processing of the associated data. Any number of HISTORY card images
-        may appear in a header. The in-memory copy of the header is not
-        updated.
+        may appear in a header.
 
         """
 
-        handler = pyfits.open(self.path, mode = 'update')
-        try:
-            header = handler[0].header
+        with self.batch_update() as header:
             header.add_history(history)
-        finally:
-            handler.close(output_verify = 'ignore')
 
     def date(self, date_keyword = 'DATE-OBS', time_keyword = 'TIME-OBS',
              exp_keyword = 'EXPTIME'):
@@ -373,23 +509,8 @@ class FITSImage(object):
         # Time format string, needed by strptime()
         format_str = '%Y-%m-%dT%H:%M:%S'
 
-        # There are two formats which only store the date, without the time:
-        # 'yy/dd/dd' (deprecated, may be used only for dates 1900-1999) and
-        # 'yyyy-mm-dd' (new, Y2K-compliant format).
-        old_date_regexp = '\d{2}/\d{2}/\d{2}'
-        date_regexp = '\d{4}-\d{2}-\d{2}' # 'yyyy-mm-dd'
-
-        # 'HH:MM:SS[.sss]': the time format. Note that we allow up to four
-        # decimals in the seconds [.ssss], instead of three. This is not
-        # standard, but used anyway in the header of O2K CAHA FITS images.
-        time_regexp = '\d{2}:\d{2}:\d{2}(?P<secs_fraction>\.\d{0,4})?'
-
-        # 'yyyy-mm-ddTHH:MM:SS[.sss]: the format that ideally we would always
-        # come across. It contains both the date and time at the start of the
-        # observation, so there is no need to read a second keyword (TIME-OBS,
-        # for example) to extract the time.
-        complete_regexp = '%sT%s' % (date_regexp, time_regexp)
-        match = re.match(complete_regexp, start_date_str)
+        # Ideal scenario: 'yyyy-mm-ddTHH:MM:SS[.sss]
+        match = COMPLETE_DATE_REGEXP.match(start_date_str)
         if match:
             if match.group('secs_fraction'):
                 format_str += '.%f'
@@ -401,9 +522,7 @@ class FITSImage(object):
         else:
 
             # Must be either 'yy/mm/dd' or 'yyyy-mm-dd'
-            args = old_date_regexp, date_regexp
-            regexp = '^((?P<old>%s)|(?P<new>%s))$' % args
-            match = re.match(regexp, start_date_str)
+            match = ONLY_DATE_REGEXP.match(start_date_str)
 
             if match:
 
@@ -415,12 +534,11 @@ class FITSImage(object):
                     start_date_str = '19' + start_date_str.replace('/', '-')
 
                 # At this point the format of the date must be 'yyyy-mm-dd'
-                assert re.match('^%s$' % date_regexp, start_date_str)
+                assert NEW_DATE_REGEXP.match(start_date_str)
 
                 # Read the time from its keyword. Does it follow the standard?
                 start_time_str = self.read_keyword(time_keyword).strip()
-                regexp = '^%s$' % time_regexp
-                time_match = re.match(regexp, start_time_str)
+                time_match = TIME_REGEXP.match(start_time_str)
 
                 if not time_match:
                     args = time_keyword, start_time_str
@@ -451,12 +569,12 @@ class FITSImage(object):
             msg = "'%s' keyword (%s) is not a floating-point number"
             raise NonStandardFITS(msg % args)
 
-        # strftime('.%f') is needed because struct_time does not store
-        # fractions of second: we need to add it after the conversion from
-        # datetime to seconds [http://stackoverflow.com/a/698279/184363]
-        seconds_fraction = float(start_date.strftime('.%f'))
-        start_struct_time = start_date.utctimetuple()
-        start_date = calendar.timegm(start_struct_time) + seconds_fraction
+        # Subtracting the Unix epoch gives us a timedelta, which (unlike the
+        # struct_time returned by utctimetuple(), which does not store the
+        # fractions of second) can be directly converted to seconds, with
+        # microsecond resolution. Both datetimes are naive and interpreted as
+        # UTC, so no timezone conversion is involved.
+        start_date = (start_date - UNIX_EPOCH).total_seconds()
         return start_date + half_exp_time
 
     def year(self, **kwargs):
@@ -619,19 +737,18 @@ class FITSImage(object):
         Note that, for an image whose filename contained no numbers, such as
         'ferM_no_number.fit', only 'ferM_no_number' would be returned.
 
+        The path to the image never changes after the object is instantiated,
+        so the prefix is computed only the first time it is accessed (e.g.,
+        when we group the images by their prefix) and cached in the instance.
+
         """
 
-        str_char = ''
-        basename = os.path.basename(self.path)
-        root = os.path.splitext(basename)[0]
-        for character in root:
-            try:
-                int(character)
-                return str_char # stop as soon as an integer is found
-            except ValueError:
-                # Raised because the character is not an integer
-                str_char += character
-        return str_char
+        if self._prefix is None:
+            basename = os.path.basename(self.path)
+            root = os.path.splitext(basename)[0]
+            # Everything up to (but not including) the first digit, if any
+            self._prefix = PREFIX_REGEXP.match(root).group(0)
+        return self._prefix
 
     @property
     def x_size(self):
@@ -783,13 +900,42 @@ class FITSImage(object):
 
     @property
     def sha1sum(self):
-        """ Return the hexadecimal SHA-1 checksum of the FITS image """
+        """ Return the hexadecimal SHA-1 checksum of the FITS image.
+
+        The checksum is cached, along with the inode number, size, and
+        modification and change times of the file when it was computed, so
+        that as long as none of these have changed it is not necessary to read
+        the entire file again. The change time cannot be set by the user (by
+        shutil.copy2(), for example), but still has a limited resolution, so
+        the checksum is not cached if the file was modified very recently (see
+        SHA1_CACHE_MIN_AGE). Any change to the header of the image via the
+        methods of this class also makes it necessary to compute it again.
+
+        """
+
+        stat_info = os.stat(self.path)
+        key = (stat_info.st_ino, stat_info.st_size,
+               stat_info.st_mtime, stat_info.st_ctime)
+        if self._sha1sum is not None and self._sha1sum[0] == key:
+            return self._sha1sum[1]
+
+        # FITS files are binary, so iterating over their 'lines' would mean
+        # splitting the data at arbitrary positions (wherever a newline byte
+        # happens to be), creating a myriad of tiny string objects. Instead,
+        # feed the file to SHA-1 in blocks of a fixed, reasonably large size.
 
         sha1 = hashlib.sha1()
         with open(self.path, 'rb') as fd:
-            for line in fd:
-                sha1.update(line)
-            return sha1.hexdigest()
+            for block in iter(lambda: fd.read(SHA1_BLOCK_SIZE), ''):
+                sha1.update(block)
+
+        digest = sha1.hexdigest()
+        age = time.time() - max(stat_info.st_mtime, stat_info.st_ctime)
+        if age >= SHA1_CACHE_MIN_AGE:
+            self._sha1sum = key, digest
+        else:
+            self._sha1sum = None
+        return digest
 
 
 class InputFITSFiles(collections.defaultdict):
@@ -845,6 +991,7 @@ def find_files(paths, followlinks = True, pattern = None):
     points to a directory it is recursively walked top-down in search of
     regular files. In other words: if the path to a directory is given, all
     the regular files in the directory tree are included in the returned list.
+    The paths are sorted lexicographically, as a single list, only at the end.
 
     Keyword arguments:
     followlinks - by default, the method will walk down into symbolic links
@@ -859,20 +1006,79 @@ def find_files(paths, followlinks = True, pattern = None):
 
     """
 
+    # fnmatch.fnmatch() normalizes the case of its arguments and looks up the
+    # translated pattern in its internal cache every time it is called, which
+    # adds up when there are hundreds of thousands of files. Translate the
+    # shell pattern to a regular expression and compile it only once instead.
+    # The most common patterns, such as '*.fits', only match the extension --
+    # for them, testing whether the base name ends with it is enough, and much
+    # faster than matching a regular expression.
+    if not pattern:
+        is_match = lambda path: True
+
+    elif SUFFIX_PATTERN_REGEXP.match(pattern):
+        suffix = os.path.normcase(pattern[1:])
+        def is_match(path):
+            """ Whether the base name of 'path' ends with 'suffix' """
+            return os.path.normcase(os.path.basename(path)).endswith(suffix)
+
+    else:
+        match = re.compile(fnmatch.translate(os.path.normcase(pattern))).match
+        def is_match(path):
+            """ Whether the base name of 'path' matches 'pattern' """
+            return match(os.path.normcase(os.path.basename(path))) is not None
+
     files_paths = []
-    for path in sorted(paths):
+    for path in paths:
         if os.path.isfile(path):
-            basename = os.path.basename(path)
-            if not pattern or fnmatch.fnmatch(basename, pattern):
+            if is_match(path):
                 files_paths.append(path)
 
         elif os.path.isdir(path):
             tree = os.walk(path, followlinks = followlinks)
-            for dirpath, dirnames, filenames in tree:
-                dirnames.sort()
-                for basename in sorted(filenames):
+            for dirpath, _, filenames in tree:
+                for basename in filenames:
+                    # os.walk() lists as 'filenames' everything that is not a
+                    # directory, so we still need to make sure that these are
+                    # regular files (or symbolic links to them). Match the
+                    # pattern first, as it saves stat(2)-ing ignored files,
+                    # and do not recursively call find_files() for each one.
                     abs_path = os.path.join(dirpath, basename)
-                    files_paths += find_files([abs_path],
-                                              followlinks = followlinks,
-                                              pattern = pattern)
+                    if is_match(abs_path) and os.path.isfile(abs_path):
+                        files_paths.append(abs_path)
+
+    # Sorting once here is cheaper than sorting the contents of each directory
+    files_paths.sort()
     return files_paths
+
+
+def saturation_mask(path, maximum):
+    """ Return the saturation mask of a FITS image, as a pyfits.PrimaryHDU.
+
+    The mask has a value of one for the pixels of the image above 'maximum',
+    and zero for all the others (including NaN pixels). This is the same that
+    IRAF's imexpr computes for the expression 'a>%d ? 1 : 0', so 'maximum'
+    is also truncated to an integer. The header of the image is kept, as the
+    WCS is needed to locate the objects on the mask, but without the BSCALE,
+    BZERO and BLANK keywords, which do not apply to the mask. If no pixel is
+    above 'maximum', None is returned, as the mask would be all zeros.
+
+    """
+
+    threshold = int(maximum)
+    # Note that we cannot pass memmap = True to pyfits.open(): it refuses to
+    # memory-map scaled images (BZERO / BSCALE), while by default it already
+    # memory-maps the file if it is possible to.
+    with pyfits.open(path) as hdulist:
+        header = hdulist[0].header.copy()
+        with numpy.errstate(invalid = 'ignore'): # NaN pixels are not saturated
+            saturated = hdulist[0].data > threshold
+
+    if not saturated.any():
+        return None
+
+    for keyword in ('BSCALE', 'BZERO', 'BLANK'):
+        if keyword in header:
+            del header[keyword]
+
+    return pyfits.PrimaryHDU(saturated.astype(numpy.int16), header)
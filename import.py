@@ -435,27 +435,30 @@ def main(arguments = None):
 
         dest_img = fitsimage.FITSImage(dest_path)
 
-        # Add some information to the FITS header...
+        # Add some information to the FITS header (writing it only once)...
         if not options.exact:
 
-            msg1 = "File imported by LEMON on %s" % util.utctime()
-            dest_img.add_history(msg1)
+            with dest_img.batch_update():
 
-            # If the --uik option is given, store in this keyword the absolute
-            # path to the image of which we made a copy. This allows other
-            # LEMON commands, if necessary, to access the original FITS files
-            # in case the imported images are modified (e.g., bias subtraction
-            # or flat-fielding) before these other commands are executed.
+                msg1 = "File imported by LEMON on %s" % util.utctime()
+                dest_img.add_history(msg1)
 
-            if options.uncimgk:
+                # If the --uik option is given, store in this keyword the
+                # absolute path to the image of which we made a copy. This
+                # allows other LEMON commands, if necessary, to access the
+                # original FITS files in case the imported images are modified
+                # (e.g., bias subtraction or flat-fielding) before these other
+                # commands are executed.
 
-                comment = "before any calibration task"
-                dest_img.update_keyword(options.uncimgk,
-                                        os.path.abspath(dest_img.path),
-                                        comment = comment)
+                if options.uncimgk:
 
-                msg2 = "[Import] Original image: %s"
-                dest_img.add_history(msg2 % os.path.abspath(fits_file.path))
+                    comment = "before any calibration task"
+                    dest_img.update_keyword(options.uncimgk,
+                                            os.path.abspath(dest_img.path),
+                                            comment = comment)
+
+                    msg2 = "[Import] Original image: %s"
+                    dest_img.add_history(msg2 % os.path.abspath(fits_file.path))
 
         # ... unless we want an exact copy of the images. If that is the case,
         # verify that the SHA-1 checksum of the original and the copy matches
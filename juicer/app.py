@@ -1261,9 +1261,11 @@ class LEMONJuicerGUI(object):
                 self.stdevs_indexes.append(length - 2)
                 self.stdevs_visibility_indexes.append(length - 1)
 
-            args = [int, str, float, str, float, float]
-            args += [float, bool] * len(db.pfilters)
-            self.store = gtk.ListStore(*args)
+            # Use db_pfilters: LEMONdB.pfilters runs a query that scans the
+            # whole photometry table every time the property is accessed.
+            column_types = (int, str, float, str, float, float)
+            column_types += (float, bool) * len(db_pfilters)
+            self.store = gtk.ListStore(*column_types)
 
             for index, attribute in enumerate(star_attrs):
                 render = gtk.CellRendererText()
@@ -1298,31 +1300,45 @@ class LEMONJuicerGUI(object):
 
                 self.view.append_column(column)
 
+            # Keep track of the fraction last shown in the progress bar, so
+            # that we do not need to ask GTK for it for each star -- there may
+            # be tens of thousands of them, but only a hundred updates.
             nstars = len(db)
+            shown_fraction = progressbar.get_fraction()
+
+            # Look up these methods only once, not for each star and filter
+            get_star = db.get_star
+            get_light_curve = db.get_light_curve
+            ra_str = util.ra_str
+            dec_str = util.dec_str
+            store_append = self.store.append
+
             for star_index, star_id in enumerate(db.star_ids):
 
                 # Has the user pressed 'Cancel'?
                 if self._aborted:
                     break
 
-                x, y, ra, dec, _, _, _, imag = db.get_star(star_id)
-                row = [star_id, util.ra_str(ra), ra, util.dec_str(dec), dec, imag]
+                x, y, ra, dec, _, _, _, imag = get_star(star_id)
+                row = [star_id, ra_str(ra), ra, dec_str(dec), dec, imag]
 
                 for pfilter in db_pfilters:
                     # None returned if the star doesn't have this light curve
-                    curve = db.get_light_curve(star_id, pfilter)
+                    curve = get_light_curve(star_id, pfilter)
                     if curve:
                         row += [curve.stdev, True]
                     else:
                         row += [UNKNOWN_VALUE, False]
 
-                self.store.append(row)
+                store_append(row)
 
                 # Update the progress bar only when the percentage varies; if,
                 # e.g., it is 0.971 (97%), setting the fraction to 0.972 (still
-                # 97%) would only unnecessarily slow down the execution.
+                # 97%) would only unnecessarily slow down the execution. This
+                # is also the only time pending GTK events are processed.
                 fraction = round(star_index / nstars, 2)
-                if fraction != progressbar.get_fraction():
+                if fraction != shown_fraction:
+                    shown_fraction = fraction
                     with util.gtk_sync():
                         progressbar.set_fraction(fraction)
 
@@ -38,6 +38,25 @@ from matplotlib.backends.backend_gtkagg \
 import glade
 import util
 
+def get_image_stats(path):
+    """ Return the size and the extreme pixel values of a FITS image.
+
+    Return a three-element tuple: the size of the image in the primary HDU of
+    the FITS file, as a (width, height) tuple, and its minimum and maximum
+    pixel values, ignoring any NaN pixels. The data is loaded with getdata(),
+    which closes the file before returning, so that the array can be freed as
+    soon as we are done with it: an HDUList caches the data of its HDUs, so
+    the pixels would stay in memory for as long as it is referenced.
+
+    """
+
+    data, header = pyfits.getdata(path, header = True)
+    # The number of pixels along the x- and y-axes, respectively, read from
+    # the header (the order of NAXISn is the reverse of that of the shape of
+    # the NumPy array).
+    size = header['NAXIS1'], header['NAXIS2']
+    return size, numpy.nanmin(data), numpy.nanmax(data)
+
 class PreferencesDialog(object):
     """ gtk.Dialog to configure the finding chart normalization parameters.
 
@@ -348,11 +367,11 @@ class FindingChartDialog(object):
         path = self.db.mosaic
         atexit.register(util.clean_tmp_files, path)
         self.wcs = astropy.wcs.WCS(path)
-        with pyfits.open(path) as hdu:
-            data = hdu[0].data
-            # Ignore any NaN pixels
-            self.data_min = numpy.nanmin(data)
-            self.data_max = numpy.nanmax(data)
+        # We only need to go once through the pixels to find the minimum and
+        # maximum values, and APLpy will load its own copy of the data, so
+        # there is no point in having ours in memory too: get_image_stats()
+        # does not keep any reference to the array once it returns.
+        size, self.data_min, self.data_max = get_image_stats(path)
 
         self.aplpy_plot = aplpy.FITSFigure(path, figure = self.figure)
         self.figure.canvas.mpl_connect('button_press_event', self.mark_closest_star)
@@ -380,7 +399,6 @@ class FindingChartDialog(object):
 
         # The dialog has always the same width; the height is adjusted
         # proportionally depending on the dimensions of the FITS image.
-        size = data.shape[::-1]
         size_ratio = size[1] / size[0]
         new_size = self.WIDTH, int(self.WIDTH * size_ratio)
         self.dialog.resize(*new_size)
@@ -36,6 +36,7 @@ import functools
 import itertools
 import logging
 import math
+import operator
 import os
 import os.path
 import re
@@ -129,6 +130,11 @@ class QPhotResult(collections.namedtuple(typename, field_names)):
 
     """
 
+    # Subclasses of namedtuple get a per-instance __dict__ unless they define
+    # __slots__ -- and there is one QPhotResult for each astronomical object
+    # measured on each image, which may add up to millions of them.
+    __slots__ = ()
+
     def snr(self, gain):
         """ Return the signal-to-noise ratio of the photometric measurement.
 
@@ -321,13 +327,16 @@ class QPhot(list):
 
         self.clear() # empty object
 
+        # Used as the prefix of the temporary files
+        basename = os.path.basename(self.path)
+
         try:
             # Temporary file to which the APPHOT text database produced by
             # qphot will be saved. Even if empty, it must be deleted before
             # calling qphot. Otherwise, an error message, stating that the
             # operation "would overwrite existing file", will be thrown.
             output_fd, qphot_output = \
-                tempfile.mkstemp(prefix = os.path.basename(self.path),
+                tempfile.mkstemp(prefix = basename,
                                  suffix = '.qphot_output', text = True)
             os.close(output_fd)
             os.unlink(qphot_output)
@@ -363,7 +372,7 @@ class QPhot(list):
             # if empty, we need to delete the temporary file created by
             # mkstemp(), as IRAF will not overwrite it.
             txdump_fd, txdump_output = \
-                tempfile.mkstemp(prefix = os.path.basename(self.path),
+                tempfile.mkstemp(prefix = basename,
                                  suffix ='.qphot_txdump', text = True)
             os.close(txdump_fd)
             os.unlink(txdump_output)
@@ -383,6 +392,30 @@ class QPhot(list):
 
                     fields = line.split()
 
+                    # Fast path: when the six fields are valid floating-point
+                    # numbers, which is the case for most objects, convert all
+                    # of them at once and log a single message, formatted only
+                    # if its level is enabled. INDEF and invalid values are the
+                    # only ones that need to be handled field by field, below.
+                    # Look for INDEF with a substring test first, as there may
+                    # be many of them (faint objects), and raising and catching
+                    # ValueError is much more expensive than that.
+                    args = None
+                    if 'INDEF' not in line:
+                        try:
+                            args = map(float, fields[:6])
+                        except ValueError:
+                            pass
+
+                    if args is not None:
+                        msg = ("%s: xcenter = %.8f, ycenter = %.8f, "
+                               "mag = %.5f, sum = %.5f, flux = %.5f, "
+                               "stdev = %.5f")
+                        msg_args = (self.path, ) + tuple(args)
+                        logging.debug(msg % msg_args)
+                        self.append(QPhotResult(*args))
+                        continue
+
                     # As of IRAF v.2.16.1, the qphot task may output an invalid
                     # floating-point number (such as "-299866.375-58") when the
                     # coordinates of the object to be measured fall considerably
@@ -492,6 +525,7 @@ def get_coords_file(coordinates, year, epoch):
     fd, path = tempfile.mkstemp(**kwargs)
     fmt = '\t'.join(['%.10f', '%.10f\n'])
 
+    lines = []
     for coord in coordinates:
 
         # Do not apply any correction if pm_ra and pm_dec are None (which means
@@ -507,9 +541,13 @@ def get_coords_file(coordinates, year, epoch):
         if coord.pm_ra or coord.pm_dec:
             coord = coord.get_exact_coordinates(year, epoch = epoch)
 
-        os.write(fd, fmt % coord[:2])
+        lines.append(fmt % coord[:2])
 
-    os.close(fd)
+    # Wrap the OS-level handle in a (buffered) file object, so that we do not
+    # issue a write(2) system call for each one of the coordinates -- there may
+    # be tens of thousands of them. Closing the file also closes the handle.
+    with os.fdopen(fd, 'w') as fd_file:
+        fd_file.writelines(lines)
     return path
 
 def run(img, coordinates, epoch,
@@ -635,6 +673,22 @@ def run(img, coordinates, epoch,
             args = orig_img_path, uncimgk, img.path
             raise IOError(msg % args)
 
+    # The saturation mask: one for the pixels above the saturation level, zero
+    # for all the others. This is what IRAF's imexpr ("a>maximum ? 1 : 0")
+    # used to compute for us, but doing it with NumPy saves us from having to
+    # spawn another IRAF task.
+    mask = fitsimage.saturation_mask(orig_img_path, maximum)
+
+    # If no pixel in the image is above the saturation level, the mask is all
+    # zeros, and so will be the flux of every object measured on it. In that
+    # case there is no need to save the mask and then do photometry for a
+    # second time: we already know that none of the objects is saturated.
+    if mask is None:
+        msg = "%s: no pixels above %d ADUs in %s, skipping saturation mask"
+        logging.debug(msg % (img.path, maximum, orig_img_path))
+        os.unlink(coords_path)
+        return img_qphot
+
     try:
         # Temporary file to which the saturation mask is saved
         basename = os.path.basename(orig_img_path)
@@ -644,27 +698,13 @@ def run(img, coordinates, epoch,
         mask_fd, satur_mask_path = tempfile.mkstemp(**kwargs)
         os.close(mask_fd)
 
-        # IRAF's imexpr won't overwrite the file. Instead, it will raise an
-        # IrafError exception stating that "IRAF task terminated abnormally
-        # ERROR (1121, "FXF: EOF encountered while reading FITS file".
+        # pyfits won't overwrite the file created by mkstemp(). Instead, it
+        # will raise IOError stating that "File ... already exists".
         os.unlink(satur_mask_path)
+        mask.writeto(satur_mask_path)
+        del mask
 
-        # The expression that will be given to 'imexpr'. The space after the
-        # colon is needed to avoid sexigesimal interpretation. 'a' is the first
-        # and only operand, linked to our image at the invokation of the task.
-        expr = "a>%d ? 1 : 0" % maximum
-        logging.debug("%s: imexpr = '%s'" % (img.path, expr))
-        logging.debug("%s: a = %s" % (img.path, orig_img_path))
-        logging.info("%s: Running IRAF's imexpr..." % img.path)
-        pyraf.iraf.images.imexpr(expr, a = orig_img_path,
-                                 output = satur_mask_path, verbose = 'yes',
-                                 Stdout = util.LoggerWriter('debug'))
-
-        assert os.path.exists(satur_mask_path)
-
-        msg = "%s: IRAF's imexpr OK" % img.path
-        logging.info(msg)
-        msg = "%s: IRAF's imexpr output = %s"
+        msg = "%s: saturation mask saved to %s"
         logging.debug(msg % (img.path, satur_mask_path))
 
         # Now we just do photometry again, on the same pixels, but this time on
@@ -687,11 +727,11 @@ def run(img, coordinates, epoch,
 
             os.unlink(coords_path)
             fd, coords_path = tempfile.mkstemp(**kwargs)
-            for object_phot in img_qphot:
-                centered_x, centered_y = object_phot.x, object_phot.y
-                ra, dec = img.pix2world(centered_x, centered_y)
-                os.write(fd, "{0} {1}\n".format(ra, dec))
-            os.close(fd)
+            with os.fdopen(fd, 'w') as fd_file:
+                for object_phot in img_qphot:
+                    centered_x, centered_y = object_phot.x, object_phot.y
+                    ra, dec = img.pix2world(centered_x, centered_y)
+                    fd_file.write("{0} {1}\n".format(ra, dec))
 
         mask_qphot = QPhot(satur_mask_path, coords_path)
         # No centering this time: if cbox != 0 the accurate centers for each
@@ -701,22 +741,20 @@ def run(img, coordinates, epoch,
         os.unlink(coords_path)
 
         assert len(img_qphot) == len(mask_qphot)
-        for object_phot, object_mask in itertools.izip(img_qphot, mask_qphot):
 
-            if __debug__:
+        # In cbox != 0 we cannot expect the coordinates to be the exact same:
+        # the previous call to run() returned x and y coordinates that we
+        # converted to celestial coordinates, and now qphot is giving as output
+        # image coordinates again. It is unavoidable to lose some precision.
+        # Anyway, this does not affect the result: photometry was still done
+        # on almost the absolute exact coordinates that we wanted it to. The
+        # check is done once, for all the objects, outside of the loop below.
 
-                # In cbox != 0 we cannot expect the coordinates to be the exact
-                # same: the previous call to run() returned x and y coordinates
-                # that we converted to celestial coordinates, and now qphot is
-                # giving as output image coordinates again. It is unavoidable
-                # to lose some precision. Anyway, this does not affect the
-                # result: photometry was still done on almost the absolute
-                # exact coordinates that we wanted it to.
-
-                if not cbox:
-                    assert object_phot.x == object_mask.x
-                    assert object_phot.y == object_mask.y
+        if __debug__ and not cbox:
+            get_xy = operator.attrgetter('x', 'y')
+            assert map(get_xy, img_qphot) == map(get_xy, mask_qphot)
 
+        for object_phot, object_mask in itertools.izip(img_qphot, mask_qphot):
             if object_mask.flux > 0:
                 object_phot = object_phot._replace(mag = float('infinity'))
     finally:
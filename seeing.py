@@ -175,8 +175,9 @@ class FITSeeingImage(fitsimage.FITSImage):
                     # see FITSImage.update_keyword() for details). The cast to
                     # str is needed because PyFITS has complained sometimes
                     # about "illegal values" if it receives a Unicode string.
-                    self.update_keyword(keywords.sex_catalog, str(self.catalog_path))
-                    self.update_keyword(keywords.sex_md5sum, sex_md5sum)
+                    with self.batch_update():
+                        self.update_keyword(keywords.sex_catalog, str(self.catalog_path))
+                        self.update_keyword(keywords.sex_md5sum, sex_md5sum)
                 except (IOError, ValueError):
                     pass
 
@@ -908,14 +909,17 @@ def main(arguments = None):
         util.owner_writable(output_path, True) # chmod u+w
         logging.debug("%s copied to %s" % (path, output_path))
         output_img = fitsimage.FITSImage(output_path)
-        output_img.add_history(history_msg1)
-        output_img.add_history(history_msg2)
-        logging.debug("%s: FITS header updated (HISTORY keywords)" % path)
-
-        # Copy the FWHM to the FITS header, for future reference
-        comment = "Margin = %d, SNR percentile = %.3f" % (options.margin, options.per)
-        output_img.update_keyword(options.fwhmk, fwhms[path], comment = comment)
-        logging.debug("%s: FITS header updated (%s keyword)" % (path, options.fwhmk))
+
+        # Write all the changes to the FITS header at once
+        with output_img.batch_update():
+            output_img.add_history(history_msg1)
+            output_img.add_history(history_msg2)
+            logging.debug("%s: FITS header updated (HISTORY keywords)" % path)
+
+            # Copy the FWHM to the FITS header, for future reference
+            comment = "Margin = %d, SNR percentile = %.3f" % (options.margin, options.per)
+            output_img.update_keyword(options.fwhmk, fwhms[path], comment = comment)
+            logging.debug("%s: FITS header updated (%s keyword)" % (path, options.fwhmk))
 
         print "%sFITS image %s saved to %s" % (style.prefix, path, output_path)
         processed += 1
@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+
+# Copyright (c) 2019 Victor Terron. All rights reserved.
+# Institute of Astrophysics of Andalusia, IAA-CSIC
+#
+# This file is part of LEMON.
+#
+# LEMON is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import mock
+
+from test import unittest
+import astrometry
+from astrometry import AstrometryNetError
+
+class AstrometryNetTest(unittest.TestCase):
+
+    def solve_field_fails(self, output):
+        """ Run astrometry_net(), making solve-field exit with an error.
+
+        Replace the call to solve-field with a mock that raises the same
+        CalledProcessError that subprocess.check_output() would raise if
+        solve-field exited with a non-zero status, after having written
+        'output' to its standard output and error. Return the exception
+        raised by astrometry_net(), which must be AstrometryNetError.
+
+        """
+
+        def check_output(args, **kwargs):
+            raise astrometry.subprocess.CalledProcessError(2, args, output)
+
+        # The version is checked before solve-field is run
+        with mock.patch.object(astrometry, 'astrometry_net_version',
+                               return_value = (0, 78)), \
+             mock.patch.object(astrometry.subprocess, 'check_output',
+                               side_effect = check_output):
+
+            with self.assertRaises(AstrometryNetError) as cm:
+                astrometry.astrometry_net('ngc2264.fits')
+            return cm.exception
+
+    def test_astrometry_net_error_output(self):
+
+        line = "simplexy: error: failed to read the image"
+        exception = self.solve_field_fails("Reading input file...\n%s\n" % line)
+        self.assertEqual(2, exception.returncode)
+        self.assertIn(line, exception.output)
+        # The output of solve-field is shown along with the error
+        self.assertIn(line, str(exception))
+
+    def test_astrometry_net_error_output_tail(self):
+
+        # Only the last ASTROMETRY_OUTPUT_TAIL bytes are kept
+        lines = ["Line %d\n" % index for index in xrange(100000)]
+        exception = self.solve_field_fails(''.join(lines))
+        size = astrometry.ASTROMETRY_OUTPUT_TAIL
+        self.assertEqual(size, len(exception.output))
+        self.assertTrue(exception.output.endswith(lines[-1]))
+        self.assertNotIn(lines[0], exception.output)
+        self.assertIn(lines[-1].strip(), str(exception))
+
+    def test_astrometry_net_error_no_output(self):
+
+        # If the output of solve-field was not captured (verbosity > 0),
+        # the message is that of subprocess.CalledProcessError
+        args = 2, ['solve-field', 'ngc2264.fits'], None
+        exception = AstrometryNetError(*args)
+        expected = str(astrometry.subprocess.CalledProcessError(*args))
+        self.assertEqual(expected, str(exception))
@@ -1294,6 +1294,8 @@ class LEMONdBTest(unittest.TestCase):
         for id_, input_info in items:
             output_info = db.get_star(id_)
             self.assertEqual(input_info, output_info)
+            # NumPy integers, such as those in a Python array, also work
+            self.assertEqual(input_info, db.get_star(numpy.int64(id_)))
 
         # DuplicateStarError must be raised if the specified ID was
         # already used for another star in the database.
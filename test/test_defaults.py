@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+
+# Copyright (c) 2019 Victor Terron. All rights reserved.
+# Institute of Astrophysics of Andalusia, IAA-CSIC
+#
+# This file is part of LEMON.
+#
+# LEMON is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+import tempfile
+
+# LEMON modules
+from test import unittest
+import defaults
+
+class AvailableCoresTest(unittest.TestCase):
+
+    # An excerpt of /proc/<pid>/status, as found on Linux
+    STATUS = ("Name:\tpython\n"
+              "State:\tR (running)\n"
+              "Cpus_allowed:\t0d03\n"
+              "Cpus_allowed_list:\t%s\n"
+              "voluntary_ctxt_switches:\t1\n")
+
+    def available_cores(self, contents):
+        """ Call _available_cores() on a status file with these contents. """
+
+        fd, path = tempfile.mkstemp(suffix = '_status')
+        try:
+            with os.fdopen(fd, 'w') as fd_file:
+                fd_file.write(contents)
+            return defaults._available_cores(status_path = path)
+        finally:
+            os.unlink(path)
+
+    def test_count_cpus(self):
+        self.assertEqual(1, defaults._count_cpus('0'))
+        self.assertEqual(4, defaults._count_cpus('0-3\n'))
+        self.assertEqual(7, defaults._count_cpus('0-3,8,10-11'))
+        self.assertEqual(3, defaults._count_cpus(' 2,5,7 '))
+        with self.assertRaises(ValueError):
+            defaults._count_cpus('')
+        with self.assertRaises(ValueError):
+            defaults._count_cpus('0-3,x')
+
+    def test_available_cores(self):
+        self.assertEqual(1, self.available_cores(self.STATUS % '5'))
+        self.assertEqual(4, self.available_cores(self.STATUS % '0-3'))
+        self.assertEqual(7, self.available_cores(self.STATUS % '0-3,8,10-11'))
+
+    def test_available_cores_fallback(self):
+
+        # If the affinity cannot be determined, use all the CPUs
+        ncpus = multiprocessing.cpu_count()
+        self.assertEqual(ncpus, self.available_cores("Name:\tpython\n"))
+        self.assertEqual(ncpus, self.available_cores(self.STATUS % 'N/A'))
+
+        path = tempfile.mktemp(suffix = '_status')
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(ncpus, defaults._available_cores(status_path = path))
+
+    def test_ncores(self):
+        # On Linux, the CPUs the process is allowed to run on
+        self.assertEqual(defaults._available_cores(), defaults.ncores)
+        self.assertTrue(1 <= defaults.ncores <= multiprocessing.cpu_count())
@@ -20,10 +20,14 @@
 
 import datetime
 import calendar
+import hashlib
+import mock
 import numpy.random
+import numpy.testing
 import os
 import pyfits
 import random
+import shutil
 import stat
 import tempfile
 import warnings
@@ -124,6 +128,10 @@ class FITSImageTest(unittest.TestCase):
             with FITSImage(path) as img:
                 self.assertEqual(img.path, path)
                 self.assertEqual(img.size, (x_size, y_size))
+                # The size is read from the NAXISn keywords, in the same
+                # order as the (reversed) shape of the NumPy array.
+                shape = pyfits.getdata(path).shape
+                self.assertEqual(img.size, shape[::-1])
 
         # IOError raised if we do not have permission to open the file...
         with self.random() as img:
@@ -168,6 +176,25 @@ class FITSImageTest(unittest.TestCase):
                 FITSImage(nonstandard_path)
             os.unlink(nonstandard_path)
 
+        # NonStandardFITS is also raised if the primary HDU has no data array
+        # (NAXIS = 0), such as in multi-extension FITS files, even if there
+        # is an image in one of the extensions.
+        empty_hdu = pyfits.PrimaryHDU()
+        self.assertEqual(0, empty_hdu.header['NAXIS'])
+        pixels = numpy.random.random_integers(0, 100, size = (10, 20))
+        for hdulist in (pyfits.HDUList([empty_hdu]),
+                        pyfits.HDUList([empty_hdu, pyfits.ImageHDU(pixels)])):
+            fd, nodata_path = tempfile.mkstemp(suffix = '.fits')
+            os.close(fd)
+            os.unlink(nodata_path)
+            hdulist.writeto(nodata_path)
+            try:
+                regexp = "primary HDU has no data"
+                with self.assertRaisesRegexp(fitsimage.NonStandardFITS, regexp):
+                    FITSImage(nodata_path)
+            finally:
+                os.unlink(nodata_path)
+
         # NonStandardFITS exception must also be raised when we try to open
         # anything that is not a FITS file. Among the countless kinds of file
         # types that could be used for this, try to open (a) an empty file...
@@ -343,6 +370,43 @@ class FITSImageTest(unittest.TestCase):
             with self.assertRaises(KeyError):
                 img.read_keyword('HIERARCH ' + keyword)
 
+    def test_batch_update(self):
+
+        keywords = {'OBJECT' : 'M101', 'OBSERVER' : "Edwin Hubble"}
+        with self.random(**keywords) as img:
+
+            # Read the keyword before it is updated, so that it is cached
+            self.assertEqual(img.read_keyword('OBJECT'), 'M101')
+
+            with img.batch_update() as header:
+                img.update_keyword('OBJECT', 'M31', comment = "Andromeda")
+                img.delete_keyword('OBSERVER')
+                img.add_history("Name of the object fixed")
+
+                # Nested calls work with the already-open FITS file
+                with img.batch_update() as nested_header:
+                    self.assertIs(nested_header, header)
+                    img.update_keyword('AIRMASS', 1.15)
+
+                # Nothing is written to disk until we exit the with statement
+                img2 = FITSImage(img.path)
+                self.assertEqual(img2.read_keyword('OBJECT'), 'M101')
+                self.assertEqual(img2.read_keyword('OBSERVER'), "Edwin Hubble")
+
+            # The in-memory copy of the header, still usable after the FITS
+            # file has been closed, reflects all the changes, and so does the
+            # file on disk, which we verify by reading the image again.
+            self.assertEqual(img.read_keyword('OBJECT'), 'M31')
+            self.assertEqual(img.read_keyword('AIRMASS'), 1.15)
+            with self.assertRaises(KeyError):
+                img.read_keyword('OBSERVER')
+
+            img2 = FITSImage(img.path)
+            self.assertEqual(img2.read_keyword('OBJECT'), 'M31')
+            self.assertEqual(img2._header.comments['OBJECT'], "Andromeda")
+            self.assertIn("Name of the object fixed", img2._header['HISTORY'])
+            self.assertEqual(img._header.items(), img2._header.items())
+
     def test_date_and_year(self):
 
         def strptime_utc(date_string):
@@ -647,3 +711,221 @@ class FITSImageTest(unittest.TestCase):
         with self.assertRaises(KeyError):
             with self.random() as img:
                 img.dec(dec_kwd)
+
+    @staticmethod
+    def sha1(path):
+        """ Return the hexadecimal SHA-1 checksum of a file. """
+        with open(path, 'rb') as fd:
+            return hashlib.sha1(fd.read()).hexdigest()
+
+    def test_sha1sum(self):
+
+        with self.random() as img:
+            checksum = self.sha1(img.path)
+            self.assertEqual(checksum, img.sha1sum)
+
+            # The file has just been created, so its timestamps cannot tell
+            # us whether it is written to again: the checksum is not cached
+            self.assertIsNone(img._sha1sum)
+
+            # Pretend that the file is old enough for its checksum to be
+            # cached: while the file does not change, it is not read again.
+            with mock.patch.object(fitsimage, 'SHA1_CACHE_MIN_AGE', 0):
+                self.assertEqual(checksum, img.sha1sum)
+                with mock.patch.object(fitsimage.hashlib, 'sha1') as sha1:
+                    self.assertEqual(checksum, img.sha1sum)
+                    sha1.assert_not_called()
+
+                # Changes made by the methods of the class are detected
+                img.update_keyword('OBJECT', 'M101')
+                self.assertIsNone(img._sha1sum)
+                new_checksum = self.sha1(img.path)
+                self.assertNotEqual(checksum, new_checksum)
+                self.assertEqual(new_checksum, img.sha1sum)
+                checksum = new_checksum
+
+                with img.batch_update():
+                    img.update_keyword('OBJECT', 'M31')
+                    img.add_history("Name of the object fixed")
+                new_checksum = self.sha1(img.path)
+                self.assertNotEqual(checksum, new_checksum)
+                self.assertEqual(new_checksum, img.sha1sum)
+
+    def test_sha1sum_same_size_rewrite(self):
+
+        # Overwrite the image with another one of the same size with
+        # shutil.copy2(), which also copies the modification time. As if
+        # both files had been written within the resolution of the filesystem
+        # timestamps, give them the same modification time: neither it nor
+        # the size changes, but the new checksum must be computed anyway.
+
+        size = self.MIN_SIZE
+        path = self.mkfits(size, size)
+        try:
+            with FITSImage(self.mkfits(size, size)) as img:
+                # A whole number of seconds is exactly representable
+                mtime = int(os.path.getmtime(path))
+                os.utime(path, (mtime, mtime))
+                os.utime(img.path, (mtime, mtime))
+                checksum = img.sha1sum
+                self.assertEqual(os.path.getsize(path),
+                                 os.path.getsize(img.path))
+                shutil.copy2(path, img.path)
+                self.assertEqual(mtime, os.path.getmtime(img.path))
+                new_checksum = self.sha1(path)
+                self.assertNotEqual(checksum, new_checksum)
+                self.assertEqual(new_checksum, img.sha1sum)
+        finally:
+            os.unlink(path)
+
+
+class FindFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        """ Create a temporary directory tree with some empty files. """
+
+        self.root = tempfile.mkdtemp()
+        for dirname in ('a', 'a/b', 'a/b/c', 'z'):
+            os.mkdir(os.path.join(self.root, dirname))
+        self.files = ['x.fits', 'a/y.fits', 'a/y.txt', 'a/b/q.FITS',
+                      'a/b/c/w.fits', 'z/k.fit']
+        self.files = [os.path.join(self.root, f) for f in self.files]
+        for path in self.files:
+            open(path, 'wt').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_find_files(self):
+
+        # The paths are returned sorted
+        expected = sorted(self.files)
+        self.assertEqual(expected, fitsimage.find_files([self.root]))
+
+        # Regular files given directly are included if they match the pattern
+        path = self.files[0]
+        self.assertEqual([path], fitsimage.find_files([path]))
+        self.assertEqual([], fitsimage.find_files([path], pattern = '*.txt'))
+
+        expected = sorted(f for f in self.files if f.endswith('.fits'))
+        result = fitsimage.find_files([self.root], pattern = '*.fits')
+        self.assertEqual(expected, sorted(result))
+
+        expected = sorted(f for f in self.files if '.fit' in f)
+        result = fitsimage.find_files([self.root], pattern = '*.fit*')
+        self.assertEqual(expected, sorted(result))
+
+        # Directories, broken symbolic links and nonexistent paths are ignored
+        os.symlink(os.path.join(self.root, 'nonexistent'),
+                   os.path.join(self.root, 'a/broken.fits'))
+        nonexistent = os.path.join(self.root, 'nonexistent.fits')
+        result = fitsimage.find_files([self.root, nonexistent],
+                                      pattern = '*.fits')
+        expected = sorted(f for f in self.files if f.endswith('.fits'))
+        self.assertEqual(expected, sorted(result))
+
+    def test_find_files_followlinks(self):
+
+        link = os.path.join(self.root, 'z/link')
+        os.symlink(os.path.join(self.root, 'a/b'), link)
+        linked = [os.path.join(link, 'q.FITS'),
+                  os.path.join(link, 'c/w.fits')]
+
+        result = fitsimage.find_files([self.root], followlinks = True)
+        self.assertEqual(sorted(self.files + linked), sorted(result))
+        result = fitsimage.find_files([self.root], followlinks = False)
+        self.assertEqual(sorted(self.files), sorted(result))
+
+
+class SaturationMaskTest(unittest.TestCase):
+
+    # A minimal WCS, which must be kept in the header of the mask
+    WCS_KEYWORDS = dict(CTYPE1 = 'RA---TAN', CTYPE2 = 'DEC--TAN',
+                        CRPIX1 = 50.0, CRPIX2 = 50.0,
+                        CRVAL1 = 98.19, CRVAL2 = 9.89,
+                        CDELT1 = -0.0001, CDELT2 = 0.0001)
+
+    @classmethod
+    def mkfits(cls, data, **keywords):
+        """ Save a NumPy array to a temporary FITS file, with a WCS.
+
+        Keyword/value pairs are stored in the header of the FITS image, in
+        addition to WCS_KEYWORDS. Return the path to the temporary FITS file.
+
+        """
+
+        hdu = pyfits.PrimaryHDU(data)
+        for keyword, value in cls.WCS_KEYWORDS.iteritems():
+            hdu.header[keyword] = value
+        for keyword, value in keywords.iteritems():
+            hdu.header[keyword] = value
+
+        fd, path = tempfile.mkstemp(suffix = '.fits')
+        os.close(fd)
+        os.unlink(path)
+        hdu.writeto(path)
+        return path
+
+    def assertMask(self, path, maximum, expected):
+        """ Assert that the mask of the image is 'expected'. """
+
+        mask = fitsimage.saturation_mask(path, maximum)
+        self.assertEqual(numpy.int16, mask.data.dtype)
+        numpy.testing.assert_array_equal(expected, mask.data)
+
+        for keyword, value in self.WCS_KEYWORDS.iteritems():
+            self.assertEqual(value, mask.header[keyword])
+        for keyword in ('BSCALE', 'BZERO', 'BLANK'):
+            self.assertNotIn(keyword, mask.header)
+
+        # The mask is saved as a 16-bit integer, non-scaled image
+        fd, mask_path = tempfile.mkstemp(suffix = '.fits')
+        os.close(fd)
+        os.unlink(mask_path)
+        try:
+            mask.writeto(mask_path)
+            with pyfits.open(mask_path) as hdulist:
+                header = hdulist[0].header
+                self.assertEqual(16, header['BITPIX'])
+                self.assertNotIn('BZERO', header)
+                numpy.testing.assert_array_equal(expected, hdulist[0].data)
+        finally:
+            os.unlink(mask_path)
+
+    def test_saturation_mask_scaled(self):
+
+        # 16-bit unsigned data is stored with BZERO = 32768
+        data = numpy.array([[100, 65535], [40000, 50000]], dtype = numpy.uint16)
+        path = self.mkfits(data)
+        try:
+            with pyfits.open(path) as hdulist:
+                self.assertEqual(32768, hdulist[0].header['BZERO'])
+            expected = [[0, 1], [0, 1]]
+            self.assertMask(path, 45000, expected)
+            self.assertIsNone(fitsimage.saturation_mask(path, 65535))
+        finally:
+            os.unlink(path)
+
+    def test_saturation_mask_blank(self):
+
+        data = numpy.array([[-32768, 10], [20000, 30000]], dtype = numpy.int16)
+        path = self.mkfits(data, BLANK = -32768)
+        try:
+            self.assertMask(path, 25000, [[0, 0], [0, 1]])
+        finally:
+            os.unlink(path)
+
+    def test_saturation_mask_float(self):
+
+        # NaN pixels are not saturated, and the saturation level is truncated
+        # to an integer, as IRAF's imexpr did with the expression 'a>%d'.
+        data = numpy.array([[numpy.nan, 1000.5], [999.0, 2000.0]],
+                           dtype = numpy.float32)
+        path = self.mkfits(data)
+        try:
+            self.assertMask(path, 1000.7, [[0, 1], [0, 1]])
+            self.assertMask(path, 1000, [[0, 1], [0, 1]])
+            self.assertMask(path, 1999.9, [[0, 0], [0, 1]])
+            self.assertIsNone(fitsimage.saturation_mask(path, 2000))
+        finally:
+            os.unlink(path)
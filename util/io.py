@@ -97,13 +97,13 @@ def owner_writable(path, add):
 
     """
 
-    # stat.ST_MODE returns the protection bits of the file.
+    # st_mode contains the protection bits of the file.
     # stat.S_IMODE returns the portion of the file's mode that can be set by
     # os.chmod(), i.e., the file's permission bits, plus the sticky bit,
     # set-group-id, and set-user-id bits (on systems that support them).
     # stat.S_IWUSR = owner has write permission.
 
-    mode = stat.S_IMODE(os.stat(path)[stat.ST_MODE])
+    mode = stat.S_IMODE(os.stat(path).st_mode)
 
     if add:
         mode |= stat.S_IWUSR    # bitwise (inclusive) OR